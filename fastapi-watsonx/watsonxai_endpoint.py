@@ -1,12 +1,12 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse
-import requests
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import StreamingResponse, ORJSONResponse
 import httpx
+import orjson
+import hashlib
 import os
 import time
-import uuid
+import random
 import logging
-import json
 from tabulate import tabulate
 from ibm_watsonx_ai import APIClient, Credentials
 from llama_index.core.llms import ChatMessage
@@ -14,19 +14,35 @@ from llama_index.llms.ibm import WatsonxLLM
 from dotenv import load_dotenv
 import asyncio
 import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional, TypedDict, Union
+from pydantic import BaseModel, Field, field_validator
 
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+@app.on_event("startup")
+async def startup_http_client():
+    """Create the shared HTTP client so all Watsonx and IAM calls reuse pooled keep-alive connections."""
+    # HTTP/2 multiplexes concurrent requests to the same region over one connection
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        # Static Content-Type/Accept headers; requests only add their Authorization header
+        headers=BASE_HEADERS
+    )
 
 # Function to check if the app is running inside Docker
 def is_running_in_docker():
     """Check if the app is running inside Docker by checking for specific environment variables or Docker files."""
     return os.path.exists('/.dockerenv') or os.getenv("DOCKER") == "true"
 
-# Logging configuration
+# Logging configuration; set LOG_LEVEL=DEBUG for the parameter tables and request/response dumps
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=(os.getenv("LOG_LEVEL") or "INFO").upper(),
     format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
@@ -67,22 +83,13 @@ WATSONX_URLS = {
     "eu-de": "https://eu-de.ml.cloud.ibm.com"
 }
 
-# Set the Watsonx URL based on the selected region
-
-
 # IBM Cloud IAM URL for fetching the token
 IAM_TOKEN_URL = "https://iam.cloud.ibm.com/identity/token"
 
-# Load IBM API key, Watsonx URL, and Project ID from environment variables
+# Load IBM API key and Project ID from environment variables
 IBM_API_KEY = os.getenv("WATSONX_IAM_APIKEY")
-WATSONX_MODELS_URL = f"{WATSONX_URLS.get(region)}/ml/v1/foundation_model_specs"
 PROJECT_ID = os.getenv("WATSONX_PROJECT_ID")
 
-# Construct Watsonx URLs with the version parameter
-WATSONX_URL = f"{WATSONX_URLS.get(region)}/ml/v1/text/generation?version={api_version}"
-WATSONX_URL_CHAT = f"{WATSONX_URLS.get(region)}/ml/v1/text/chat?version={api_version}"
-WATSONX_URL_STREAM = f"{WATSONX_URLS.get(region)}/ml/v1/text/chat_stream?version={api_version}"
-
 if not IBM_API_KEY:
     logger.error("IBM API key is not set. Please set the WATSONX_IAM_APIKEY environment variable.")
     raise SystemExit("IBM API key is required.")
@@ -91,130 +98,253 @@ if not PROJECT_ID:
     logger.error("Watsonx.ai project ID is not set. Please set the WATSONX_PROJECT_ID environment variable.")
     raise SystemExit("Watsonx.ai project ID is required.")
 
-# Global variables to cache the IAM token and expiration time
-cached_token = None
-token_expiration = 0
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Watsonx connection settings for the selected region, resolved once at startup."""
+    base_url: str
+    watsonx_url: str
+    watsonx_url_chat: str
+    watsonx_url_stream: str
+    watsonx_models_url: str
+    project_id: str
+    # Kept out of the repr so the IAM API key never ends up in logs or tracebacks
+    api_key: str = field(repr=False)
+
+# Build the settings on first use; later calls return the same instance
+@lru_cache
+def settings():
+    # Set the Watsonx URL based on the selected region
+    base_url = WATSONX_URLS.get(region)
+    return Settings(
+        base_url=base_url,
+        # Construct Watsonx URLs with the version parameter
+        watsonx_url=f"{base_url}/ml/v1/text/generation?version={api_version}",
+        watsonx_url_chat=f"{base_url}/ml/v1/text/chat?version={api_version}",
+        watsonx_url_stream=f"{base_url}/ml/v1/text/chat_stream?version={api_version}",
+        watsonx_models_url=f"{base_url}/ml/v1/foundation_model_specs",
+        project_id=PROJECT_ID,
+        api_key=IBM_API_KEY
+    )
 
-# Function to fetch the IAM token
-def get_iam_token():
-    global cached_token, token_expiration
-    current_time = time.time()
+# Non-cryptographic generator for response IDs and fingerprints, seeded once from the OS
+id_rng = random.Random()
 
-    if cached_token and current_time < token_expiration:
-        logger.debug("Using cached IAM token.")
-        return cached_token
+# Return 12 random hex characters for chatcmpl-/cmpl-/fp_ identifiers
+def random_id():
+    return id_rng.randbytes(6).hex()
+
+# Static headers (set as the shared client's defaults) and generation parameters for every Watsonx request
+BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json"
+}
+BASE_PARAMS = {
+    "decoding_method": "sample",  # decoding_method = Greedy is not supported.
+    "top_k": 50
+}
+
+# Fraction of the IAM token lifetime after which the background task refreshes it
+TOKEN_REFRESH_FRACTION = 0.8
+# Seconds before the real expiry at which a cached IAM token is no longer handed out
+TOKEN_EXPIRY_MARGIN = 300
+# The background refresh always runs at least this many seconds before the token stops being handed out
+TOKEN_REFRESH_LEAD = 60
+
+@dataclass
+class IAMToken:
+    """Cached IAM access token with its absolute refresh and expiry times (epoch seconds)."""
+    token: Optional[str] = None
+    expiry: float = 0
+    refresh_at: float = 0
+
+    def is_valid(self):
+        return self.token is not None and time.time() < self.expiry - TOKEN_EXPIRY_MARGIN
+
+# Guards IAM token refreshes so only one request to IBM Cloud is in flight
+token_lock = asyncio.Lock()
 
+# Function to fetch a new IAM token and store it on the app state
+async def refresh_iam_token():
     logger.debug("Fetching new IAM token from IBM Cloud...")
 
     try:
-        response = requests.post(
+        response = await app.state.http.post(
             IAM_TOKEN_URL,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
             data={
                 "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-                "apikey": IBM_API_KEY,
+                "apikey": settings().api_key,
             },
         )
         response.raise_for_status()
         token_data = response.json()
-        cached_token = token_data["access_token"]
         expires_in = token_data["expires_in"]
 
-        token_expiration = current_time + expires_in - 600
-        logger.debug(f"IAM token fetched, expires in {expires_in} seconds.")
+        fetched_at = time.time()
+        expiry = fetched_at + expires_in
+        app.state.token = IAMToken(
+            token=token_data["access_token"],
+            expiry=expiry,
+            # For short-lived tokens the fixed margin comes before the 80% mark; refresh ahead of it
+            refresh_at=min(
+                fetched_at + expires_in * TOKEN_REFRESH_FRACTION,
+                expiry - TOKEN_EXPIRY_MARGIN - TOKEN_REFRESH_LEAD
+            )
+        )
+        logger.debug("IAM token fetched, expires in %s seconds.", expires_in)
 
-        return cached_token
-    except requests.exceptions.RequestException as err:
+        return app.state.token.token
+    except httpx.HTTPError as err:
         logger.error(f"Error fetching IAM token: {err}")
         raise HTTPException(status_code=500, detail=f"Error fetching IAM token: {err}")
+    except (KeyError, TypeError, ValueError) as err:
+        # A reply that is not JSON or lacks access_token/expires_in
+        logger.error(f"Invalid IAM token response: {err!r}")
+        raise HTTPException(status_code=500, detail=f"Invalid IAM token response: {err!r}")
+
+# Function to get the IAM token, normally served from the cache kept fresh by the background task
+async def get_iam_token():
+    if app.state.token.is_valid():
+        logger.debug("Using cached IAM token.")
+        return app.state.token.token
+
+    # The background refresh is late (e.g. clock skew or a failed refresh); refresh inline once.
+    # Concurrent callers wait on the lock and re-check, so only the first one calls IBM Cloud.
+    async with token_lock:
+        if app.state.token.is_valid():
+            logger.debug("Using IAM token refreshed by a concurrent request.")
+            return app.state.token.token
+        return await refresh_iam_token()
+
+# Background task that refreshes the IAM token shortly before it expires
+async def token_refresher():
+    while True:
+        delay = app.state.token.refresh_at - time.time()
+        await asyncio.sleep(max(delay, 60))
+        try:
+            async with token_lock:
+                # Skip the refresh if a request already renewed the token while we slept
+                if time.time() < app.state.token.refresh_at:
+                    continue
+                await refresh_iam_token()
+        except HTTPException:
+            # Already logged; retry on the next iteration
+            pass
+        except Exception:
+            # Never let an unexpected error end the refresh loop
+            logger.exception("Unexpected error refreshing the IAM token, will retry.")
+
+@app.on_event("startup")
+async def startup_token_refresher():
+    """Fetch the initial IAM token and start the background refresh task."""
+    app.state.token = IAMToken()
+    try:
+        await refresh_iam_token()
+    except HTTPException:
+        logger.warning("Initial IAM token fetch failed, will retry on first request.")
+    app.state.token_refresher = asyncio.create_task(token_refresher())
+
+@app.on_event("shutdown")
+async def shutdown_token_refresher():
+    """Cancel the background IAM token refresh task."""
+    app.state.token_refresher.cancel()
+    try:
+        await app.state.token_refresher
+    except asyncio.CancelledError:
+        pass
 
-def format_debug_output(request_data):
-    headers = ["by API", "Parameter", "API Value", "Default Value", "Explanation"]
-    table = []
-    # Define the parameters excluding "Prompt" and add explanations
-    parameters = [
-        ("Model ID", request_data.get("model", "ibm/granite-20b-multilingual"), "ibm/granite-20b-multilingual",
-        "ID of the model to use for completion"),
+# Registered after shutdown_token_refresher: shutdown hooks run in order, and an in-flight refresh still needs the client
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """Close the shared HTTP client and release its pooled connections."""
+    await app.state.http.aclose()
 
-        ("Max Tokens", request_data.get("max_tokens", 2000), 2000,
-        "Maximum number of tokens to generate in the completion. The total tokens, prompt + completion."),
+# Parameters shown by format_debug_output: (label, request key, default value, explanation)
+DEBUG_PARAMETERS = (
+    ("Model ID", "model", "ibm/granite-20b-multilingual",
+    "ID of the model to use for completion"),
 
-        ("Temperature", request_data.get("temperature", 0.2), 0.2,
-        "Controls the randomness of the generated output. Higher values make the output more random."),
+    ("Max Tokens", "max_tokens", 2000,
+    "Maximum number of tokens to generate in the completion. The total tokens, prompt + completion."),
 
-        ("Presence Penalty", request_data.get("presence_penalty", 1), 1,
-        "Penalizes new tokens based on whether they appear in the text so far. Positive values encourage the model to talk about new topics."),
+    ("Temperature", "temperature", 0.2,
+    "Controls the randomness of the generated output. Higher values make the output more random."),
 
-        ("top_p", request_data.get("top_p", 1), 1,
-        "Nucleus sampling parameter. For example, top_p = 0.1 means the model will consider only the top 10% probability tokens."),
+    ("Presence Penalty", "presence_penalty", 1,
+    "Penalizes new tokens based on whether they appear in the text so far. Positive values encourage the model to talk about new topics."),
 
-        ("best_of", request_data.get("best_of", 1), 1,
-        "Generates multiple completions server-side, returning the 'best' one (the one with the highest log probability)."),
+    ("top_p", "top_p", 1,
+    "Nucleus sampling parameter. For example, top_p = 0.1 means the model will consider only the top 10% probability tokens."),
 
-        ("echo", request_data.get("echo", False), False,
-        "If set to True, echoes the prompt back along with the completion. Useful for debugging purposes."),
+    ("best_of", "best_of", 1,
+    "Generates multiple completions server-side, returning the 'best' one (the one with the highest log probability)."),
 
-        ("n", request_data.get("n", 1), 1,
-        "Number of completions to generate for each prompt. Note that this can quickly consume your token quota."),
+    ("echo", "echo", False,
+    "If set to True, echoes the prompt back along with the completion. Useful for debugging purposes."),
 
-        ("seed", request_data.get("seed", None), None,
-        "If specified, ensures deterministic outputs, meaning repeated requests with the same seed and parameters should return the same result."),
+    ("n", "n", 1,
+    "Number of completions to generate for each prompt. Note that this can quickly consume your token quota."),
 
-        ("stop", request_data.get("stop", None), None,
-        "Up to 4 sequences where the model will stop generating further tokens. The generated text will not contain the stop sequence."),
+    ("seed", "seed", None,
+    "If specified, ensures deterministic outputs, meaning repeated requests with the same seed and parameters should return the same result."),
 
-        ("logit_bias", request_data.get("logit_bias", None), None,
-        "A JSON object that adjusts the likelihood of specified tokens appearing in the completion. Maps token IDs to a bias value from -100 to 100."),
+    ("stop", "stop", None,
+    "Up to 4 sequences where the model will stop generating further tokens. The generated text will not contain the stop sequence."),
 
-        ("logprobs", request_data.get("logprobs", None), None,
-        "Includes the log probabilities on the logprobs most likely tokens, as well as the chosen tokens. Useful for analyzing the model's decision process."),
+    ("logit_bias", "logit_bias", None,
+    "A JSON object that adjusts the likelihood of specified tokens appearing in the completion. Maps token IDs to a bias value from -100 to 100."),
 
-        ("stream", request_data.get("stream", False), False,
-        "If set to True, streams back partial progress as the model generates tokens in real-time."),
+    ("logprobs", "logprobs", None,
+    "Includes the log probabilities on the logprobs most likely tokens, as well as the chosen tokens. Useful for analyzing the model's decision process."),
 
-        ("suffix", request_data.get("suffix", None), None,
-        "Specifies a suffix that comes after the generated text. Useful for inserting text after a completion.")
-    ]
+    ("stream", "stream", False,
+    "If set to True, streams back partial progress as the model generates tokens in real-time."),
 
+    ("suffix", "suffix", None,
+    "Specifies a suffix that comes after the generated text. Useful for inserting text after a completion."),
+)
 
-    # ANSI escape codes for colors
-    green = "\033[92m"
-    yellow = "\033[93m"
-    reset = "\033[0m"
+# ANSI escape codes for colors
+DEBUG_GREEN = "\033[92m"
+DEBUG_YELLOW = "\033[93m"
+DEBUG_RESET = "\033[0m"
+DEBUG_HEADERS = ["by API", "Parameter", "API Value", "Default Value", "Explanation"]
 
-    for param, api_value, default_value, explanation in parameters:
-        # Determine if the parameter was provided by the API (yellow) or using default (green)
-        if api_value is not None:
-            # Use yellow for rows where the API value differs from the default
-            color = yellow
-            provided_by_api = f"{yellow}X{reset}"
-        else:
-            # Use green for rows with default values
-            color = green
-            provided_by_api = ""
-
-        # Append the row with color applied to the entire line
-        table.append([
-            provided_by_api,  # First column: Provided by API
-            f"{color}{param}{reset}",
-            f"{color}\"{api_value}\"{reset}" if isinstance(api_value, str) else f"{color}{api_value}{reset}",
-            f"{color}{default_value}{reset}",
-            f"{color}{explanation}{reset}"
-        ])
+def _debug_columns(color, param, default_value, explanation):
+    return (f"{color}{param}{DEBUG_RESET}", f"{color}{default_value}{DEBUG_RESET}", f"{color}{explanation}{DEBUG_RESET}")
+
+# Static columns of each debug row, precomputed in yellow (provided by API) and green (default)
+DEBUG_ROWS = tuple(
+    (key, default_value, _debug_columns(DEBUG_YELLOW, param, default_value, explanation), _debug_columns(DEBUG_GREEN, param, default_value, explanation))
+    for param, key, default_value, explanation in DEBUG_PARAMETERS
+)
+DEBUG_PROVIDED_BY_API = f"{DEBUG_YELLOW}X{DEBUG_RESET}"
+
+def _debug_row(api_value, yellow_columns, green_columns):
+    # Use yellow for rows where the parameter was provided by the API, green for default values
+    if api_value is None:
+        param, default_value, explanation = green_columns
+        return ["", param, f"{DEBUG_GREEN}{api_value}{DEBUG_RESET}", default_value, explanation]
+    param, default_value, explanation = yellow_columns
+    api_value = f"\"{api_value}\"" if isinstance(api_value, str) else api_value
+    return [DEBUG_PROVIDED_BY_API, param, f"{DEBUG_YELLOW}{api_value}{DEBUG_RESET}", default_value, explanation]
+
+def format_debug_output(request_data):
+    # Only the API value column is computed per request; the rest of each row is precomputed
+    table = [
+        _debug_row(request_data.get(key, default_value), yellow_columns, green_columns)
+        for key, default_value, yellow_columns, green_columns in DEBUG_ROWS
+    ]
 
     # Align the "Provided by API" and "Parameter" columns to the left, as well as "Explanation"
-    return tabulate(table, headers, tablefmt="pretty", colalign=("center", "left", "center", "center", "left"))
+    return tabulate(table, DEBUG_HEADERS, tablefmt="pretty", colalign=("center", "left", "center", "center", "left"))
 
 
 # Fetch the models from Watsonx
-def get_watsonx_models():
+async def get_watsonx_models():
     try:
-        token = get_iam_token()
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        token = await get_iam_token()
+        headers = {"Authorization": f"Bearer {token}"}
 
         # Send request to Watsonx models endpoint
         params = {
@@ -222,8 +352,8 @@ def get_watsonx_models():
             "filters": "function_text_generation,!lifecycle_withdrawn:and",
             "limit": 200
         }
-        response = requests.get(
-            WATSONX_MODELS_URL,
+        response = await app.state.http.get(
+            settings().watsonx_models_url,
             headers=headers,
             params=params
         )
@@ -235,155 +365,221 @@ def get_watsonx_models():
         response.raise_for_status()  # Raise exception for any non-200 status codes
         models_data = response.json()
         return models_data
-    except requests.exceptions.RequestException as err:
+    except httpx.HTTPError as err:
         logger.error(f"Error fetching models from Watsonx.ai: {err}")
         raise HTTPException(status_code=500, detail=f"Error fetching models from Watsonx.ai: {err}")
 
 
-# Convert Watsonx models to OpenAI-like format
-def convert_watsonx_to_openai_format(watsonx_data):
-    openai_models = []
-
-    for model in watsonx_data['resources']:
-        openai_model = {
-            "id": model['model_id'],  # Watsonx's model_id maps to OpenAI's id
-            "object": "model",  # Hardcoded, as OpenAI uses "model" as the object type
-            "created": int(time.time()),  # Optional: use current timestamp or a fixed one if available
-            "owned_by": f"{model['provider']} / {model['source']}",  # Combine Watsonx's provider and source
-            "description": f"{model['short_description']} Supports tasks like {', '.join(model.get('task_ids', []))}.",  # Watsonx's short description
-            "max_tokens": model['model_limits']['max_output_tokens'],  # Map Watsonx's max_output_tokens to OpenAI's max_tokens
-            "token_limits": {
-                "max_sequence_length": model['model_limits']['max_sequence_length'],  # Watsonx's max_sequence_length
-                "max_output_tokens": model['model_limits']['max_output_tokens']  # Watsonx's max_output_tokens
-            }
+# Convert a single Watsonx model to OpenAI-like format
+def convert_watsonx_model(model):
+    return {
+        "id": model['model_id'],  # Watsonx's model_id maps to OpenAI's id
+        "object": "model",  # Hardcoded, as OpenAI uses "model" as the object type
+        "created": int(time.time()),  # Optional: use current timestamp or a fixed one if available
+        "owned_by": f"{model['provider']} / {model['source']}",  # Combine Watsonx's provider and source
+        "description": f"{model['short_description']} Supports tasks like {', '.join(model.get('task_ids', []))}.",  # Watsonx's short description
+        "max_tokens": model['model_limits']['max_output_tokens'],  # Map Watsonx's max_output_tokens to OpenAI's max_tokens
+        "token_limits": {
+            "max_sequence_length": model['model_limits']['max_sequence_length'],  # Watsonx's max_sequence_length
+            "max_output_tokens": model['model_limits']['max_output_tokens']  # Watsonx's max_output_tokens
         }
-        openai_models.append(openai_model)
+    }
 
+# Convert Watsonx models to OpenAI-like format
+def convert_watsonx_to_openai_format(watsonx_data):
     return {
-        "data": openai_models
+        "data": [convert_watsonx_model(model) for model in watsonx_data['resources']]
     }
 
+# How long the model catalog is served from the cache before it is fetched again
+MODELS_CACHE_TTL = int(os.getenv("WATSONX_MODELS_CACHE_TTL") or 600)
+# Mixed into the models ETag; bump it whenever convert_watsonx_model changes the served shape
+MODELS_FORMAT_VERSION = b"1"
+
+# Cached Watsonx model catalog in OpenAI-like format, plus an index by model ID
+# and the serialized model list with its ETag
+app.state.models_cache = {"data": None, "by_id": {}, "body": b"", "etag": None, "expiry": 0}
+models_lock = asyncio.Lock()
+
+# Return the cached model catalog, fetching it from Watsonx when it is missing or expired
+async def cached_models():
+    cache = app.state.models_cache
+    if cache["data"] is not None and time.time() < cache["expiry"]:
+        return cache
+
+    async with models_lock:
+        cache = app.state.models_cache
+        if cache["data"] is not None and time.time() < cache["expiry"]:
+            return cache
+
+        models = await get_watsonx_models()
+        logger.debug("Available models: %s", models)
+        # The ETag hashes the Watsonx catalog itself, not the converted list with its per-refresh "created" stamps.
+        # It is weak because workers and restarts serve the same catalog with different "created" values.
+        catalog = MODELS_FORMAT_VERSION + orjson.dumps(models["resources"], option=orjson.OPT_SORT_KEYS)
+        etag = f'W/"{hashlib.sha1(catalog).hexdigest()}"'
+        if etag == cache["etag"]:
+            # Unchanged catalog: keep the converted list, body and ETag so polling clients keep getting 304s
+            app.state.models_cache = {**cache, "expiry": time.time() + MODELS_CACHE_TTL}
+            return app.state.models_cache
 
-# FastAPI route for /v1/models
-@app.get("/v1/chat/models")
-async def fetch_models():
+        openai_like_models = convert_watsonx_to_openai_format(models)
+        app.state.models_cache = {
+            "data": openai_like_models,
+            "by_id": {model["id"]: model for model in openai_like_models["data"]},
+            "body": orjson.dumps(openai_like_models),
+            "etag": etag,
+            "expiry": time.time() + MODELS_CACHE_TTL
+        }
+        return app.state.models_cache
+
+# True when an If-None-Match header names the ETag; weak comparison applies, and "*" matches any catalog
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+
+# FastAPI route for /v1/models, also served under the n8n (/v1/chat/chat/models) and standard OpenAI paths
+@app.get("/v1/chat/models", response_model=None, response_class=ORJSONResponse)
+@app.get("/v1/chat/chat/models", response_model=None, response_class=ORJSONResponse)
+@app.get("/v1/models", response_model=None, response_class=ORJSONResponse)
+async def fetch_models(request: Request):
     logger.info("get the model list")
     try:
-        models = get_watsonx_models()  # Fetch the Watsonx models data
-        logger.debug(f"Available models: {models}")
-
-        # Convert Watsonx output to OpenAI-like format
-        openai_like_models = convert_watsonx_to_openai_format(models)
-
-        # Return the OpenAI-like formatted models
-        return openai_like_models
+        cache = await cached_models()
     except Exception as err:
         logger.error(f"Error fetching models: {err}")
         raise HTTPException(status_code=500, detail=f"Error fetching models: {err}")
 
-# FastAPI route for /v1/models/{model_id}
-@app.get("/v1/chat/models/{model_id}")
+    # Polling clients that already hold this catalog get a bodiless 304
+    headers = {"ETag": cache["etag"], "Cache-Control": "public, max-age=300"}
+    if etag_matches(request.headers.get("if-none-match"), cache["etag"]):
+        return Response(status_code=304, headers=headers)
+    # Return the cached OpenAI-like formatted models, already serialized
+    return Response(content=cache["body"], media_type="application/json", headers=headers)
+
+# FastAPI route for /v1/models/{model_id}, also served under the n8n and standard OpenAI paths
+@app.get("/v1/chat/models/{model_id}", response_model=None, response_class=ORJSONResponse)
+@app.get("/v1/chat/chat/models/{model_id}", response_model=None, response_class=ORJSONResponse)
+@app.get("/v1/models/{model_id}", response_model=None, response_class=ORJSONResponse)
 async def fetch_model_by_id(model_id: str):
     logger.info(f"get the model with id {model_id}")
     try:
-        # Fetch the full list of models from Watsonx
-        models = get_watsonx_models()
-
-        # Search for the model with the specific model_id
-        model = next((m for m in models['resources'] if m['model_id'] == model_id), None)
-
-        if model:
-            # Convert the model details to OpenAI-like format
-            openai_model = {
-                "id": model['model_id'],  # Watsonx's model_id maps to OpenAI's id
-                "object": "model",  # Hardcoded, as OpenAI uses "model" as the object type
-                "created": int(time.time()),  # Optional: use current timestamp or a fixed one if available
-                "owned_by": f"{model['provider']} / {model['source']}",  # Combine Watsonx's provider and source
-                "description": f"{model['short_description']} Supports tasks like {', '.join(model.get('task_ids', []))}.",  # Watsonx's short description
-                "max_tokens": model['model_limits']['max_output_tokens'],  # Map Watsonx's max_output_tokens to OpenAI's max_tokens
-                "token_limits": {
-                    "max_sequence_length": model['model_limits']['max_sequence_length'],  # Watsonx's max_sequence_length
-                    "max_output_tokens": model['model_limits']['max_output_tokens']  # Watsonx's max_output_tokens
-                }
-            }
-            return {"data": [openai_model]}
-
-        # If model not found, raise a 404 error
-        raise HTTPException(status_code=404, detail=f"Model with ID {model_id} not found.")
-
+        # Look up the already converted model in the cached index
+        openai_model = (await cached_models())["by_id"].get(model_id)
     except Exception as err:
         logger.error(f"Error fetching model by ID: {err}")
         raise HTTPException(status_code=500, detail=f"Error fetching model by ID: {err}")
 
-@app.post("/v1/completions")
-async def watsonx_completions(request: Request):
-    logger.info("Received a Watsonx completion request.")
-
-    # Parse the incoming request as JSON
-    try:
-        request_data = await request.json()
-    except Exception as e:
-        logger.error(f"Error parsing request: {e}")
-        raise HTTPException(status_code=400, detail="Invalid JSON request body")
+    # If model not found, raise a 404 error
+    if openai_model is None:
+        raise HTTPException(status_code=404, detail=f"Model with ID {model_id} not found.")
 
-    # Extract parameters from request or set default values
-    prompt = request_data.get("prompt", "")
+    return ORJSONResponse({"data": [openai_model]})
+
+# OpenAI text completion request body; unknown fields are kept so clients may send extras
+class CompletionRequest(BaseModel):
+    model_config = {"extra": "allow"}
+
+    model: str = "ibm/granite-20b-multilingual"
+    prompt: Union[str, list[str]] = ""
+    max_tokens: int = 2000
+    temperature: float = 0.2
+    best_of: int = 1
+    n: int = 1
+    presence_penalty: float = 1
+    echo: bool = False
+    logit_bias: Optional[dict] = None
+    logprobs: Optional[int] = None
+    stop: Optional[Union[str, list[str]]] = None
+    suffix: Optional[str] = None
+    stream: bool = False
+    # Watsonx takes a 32-bit random_seed; larger ints would also overflow orjson
+    seed: Optional[int] = Field(None, ge=0, le=2**32 - 1)
+    top_p: float = 1
+
+    # Tool calling parameters that n8n/LangChain might send
+    tools: Optional[list] = None
+    functions: Optional[list] = None  # Legacy functions parameter
+    tool_choice: Optional[Union[str, dict]] = None
+    function_call: Optional[Union[str, dict]] = None  # Legacy function_call parameter
+
+    # OpenAI accepts null for these; treat it as "not provided" and use the default
+    @field_validator("max_tokens", "temperature", "best_of", "n", "presence_penalty", "echo", "stream", "top_p", mode="before")
+    @classmethod
+    def null_to_default(cls, value, info):
+        return cls.model_fields[info.field_name].default if value is None else value
+
+# OpenAI text completion response shape, returned as a plain dict and serialized by orjson
+class CompletionChoice(TypedDict):
+    text: str
+    index: int
+    logprobs: Optional[dict]
+    finish_reason: str
+
+class CompletionUsage(TypedDict):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+class CompletionResponse(TypedDict):
+    id: str
+    object: str
+    created: int
+    model: str
+    system_fingerprint: str
+    choices: list[CompletionChoice]
+    usage: CompletionUsage
+
+@app.post("/v1/completions", response_model=None, response_class=ORJSONResponse)
+async def watsonx_completions(body: CompletionRequest):
+    logger.info("Received a Watsonx completion request.")
+    s = settings()
 
-    # Ensure that prompt is a string; if it's a list, join it into a single string
+    # The request body is parsed and validated by Pydantic; a list prompt is joined into a single string
+    prompt = body.prompt
     if isinstance(prompt, list):
         prompt = " ".join(prompt)
-    elif not isinstance(prompt, str):
-        logger.error(f"Invalid type for 'prompt': {type(prompt)}. Expected a string or list of strings.")
-        raise HTTPException(status_code=400, detail="Invalid type for 'prompt'. Expected a string or list of strings.")
 
     # Rest of the parameters (model_id, max_tokens, etc.)
-    model_id = request_data.get("model", "ibm/granite-20b-multilingual")  # Default model_id
-    max_tokens = request_data.get("max_tokens", 2000)
-    temperature = request_data.get("temperature", 0.2)
-    best_of = request_data.get("best_of", 1)
-    n = request_data.get("n", 1)
-    presence_penalty = request_data.get("presence_penalty", 1)
-    echo = request_data.get("echo", False)
-    logit_bias = request_data.get("logit_bias", None)
-    logprobs = request_data.get("logprobs", None)
-    stop = request_data.get("stop", None)
-    suffix = request_data.get("suffix", None)
-    stream = request_data.get("stream", False)
-    seed = request_data.get("seed", None)
-    top_p = request_data.get("top_p", 1)
+    model_id = body.model
+    max_tokens = body.max_tokens
+    temperature = body.temperature
+    presence_penalty = body.presence_penalty
+    logit_bias = body.logit_bias
+    stop = body.stop
+    seed = body.seed
+    top_p = body.top_p
 
-    # Handle tool calling parameters that n8n/LangChain might send
-    tools = request_data.get("tools", None)
-    functions = request_data.get("functions", None)  # Legacy functions parameter
-    tool_choice = request_data.get("tool_choice", None)
-    function_call = request_data.get("function_call", None)  # Legacy function_call parameter
-    
     # Log if tool calling is being attempted
-    if tools or functions or tool_choice or function_call:
-        logger.info(f"Tool calling detected - tools: {tools}, functions: {functions}, tool_choice: {tool_choice}, function_call: {function_call}")
+    if body.tools or body.functions or body.tool_choice or body.function_call:
+        logger.info(f"Tool calling detected - tools: {body.tools}, functions: {body.functions}, tool_choice: {body.tool_choice}, function_call: {body.function_call}")
         logger.warning("Tool calling is not fully supported by Watsonx. Converting to regular chat completion.")
 
     # Debugging: Log the provided parameters and their sources
-    logger.debug("Parameter source debug:")
-    logger.debug("\n" + format_debug_output(request_data))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Parameter source debug:\n%s", format_debug_output(body.model_dump(exclude_unset=True)))
 
     # Get the IAM token
-    iam_token = get_iam_token()
+    iam_token = await get_iam_token()
 
     # Prepare Watsonx.ai request payload
     watsonx_payload = {
         "input": prompt,  # Ensure 'prompt' is always a string
         "parameters": {
-            "decoding_method": "sample",  # decoding_method = Greedy is not supported.
+            **BASE_PARAMS,
             "max_new_tokens": max_tokens,
             "temperature": temperature,
-            "top_k": 50,
             "top_p": top_p,
             "random_seed": seed,
             "repetition_penalty": presence_penalty,
         },
         "model_id": model_id,
-        "project_id": PROJECT_ID
+        "project_id": s.project_id
     }
 
     # Optionally add optional parameters if provided
@@ -393,27 +589,25 @@ async def watsonx_completions(request: Request):
         watsonx_payload["parameters"]["logit_bias"] = logit_bias
 
     # Log the prettified JSON request
-    formatted_payload = json.dumps(watsonx_payload, indent=4, ensure_ascii=False)
-    logger.debug(f"Sending request to Watsonx.ai: {formatted_payload}")
+    if logger.isEnabledFor(logging.DEBUG):
+        formatted_payload = orjson.dumps(watsonx_payload, option=orjson.OPT_INDENT_2).decode()
+        logger.debug("Sending request to Watsonx.ai: %s", formatted_payload)
 
-    headers = {
-        "Authorization": f"Bearer {iam_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {iam_token}"}
 
     try:
         # Send the request to Watsonx.ai
-        response = requests.post(WATSONX_URL, json=watsonx_payload, headers=headers)
+        response = await app.state.http.post(s.watsonx_url, content=orjson.dumps(watsonx_payload), headers=headers)
         response.raise_for_status()  # This will raise an HTTPError for 4xx/5xx responses
-        watsonx_data = response.json()
-        logger.debug(f"Received response from Watsonx.ai: {json.dumps(watsonx_data, indent=4)}")
-    except requests.exceptions.HTTPError as err:
+        watsonx_data = orjson.loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received response from Watsonx.ai: %s", orjson.dumps(watsonx_data, option=orjson.OPT_INDENT_2).decode())
+    except httpx.HTTPStatusError as err:
         # Capture and log the full response from Watsonx.ai
         error_message = response.text  # Watsonx should return a more detailed error message
         logger.error(f"HTTPError: {err}, Response: {error_message}")
         raise HTTPException(status_code=response.status_code, detail=f"Error from Watsonx.ai: {error_message}")
-    except requests.exceptions.RequestException as err:
+    except httpx.RequestError as err:
         # Generic request exception handling
         logger.error(f"RequestException: {err}")
         raise HTTPException(status_code=500, detail=f"Error calling Watsonx.ai: {err}")
@@ -422,18 +616,18 @@ async def watsonx_completions(request: Request):
     results = watsonx_data.get("results", [])
     if results and "generated_text" in results[0]:
         generated_text = results[0]["generated_text"]
-        logger.debug(f"Generated text from Watsonx.ai: \n{generated_text}")
+        logger.debug("Generated text from Watsonx.ai: \n%s", generated_text)
     else:
         generated_text = "\n\nNo response available."
         logger.warning("No generated text found in Watsonx.ai response.")
 
     # Prepare the OpenAI-compatible response with model name
-    openai_response = {
-        "id": f"cmpl-{str(uuid.uuid4())[:12]}",
+    openai_response: CompletionResponse = {
+        "id": f"cmpl-{random_id()}",
         "object": "text_completion",
         "created": int(time.time()),
         "model": model_id,
-        "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
+        "system_fingerprint": f"fp_{random_id()}",
         "choices": [
             {
                 "text": generated_text,
@@ -450,30 +644,81 @@ async def watsonx_completions(request: Request):
     }
 
     # Return the response
-    logger.debug(f"Returning OpenAI-compatible response: {json.dumps(openai_response, indent=4)}")
-    return openai_response
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Returning OpenAI-compatible response: %s", orjson.dumps(openai_response, option=orjson.OPT_INDENT_2).decode())
+    # Return the response directly so FastAPI skips the jsonable_encoder pass
+    return ORJSONResponse(openai_response)
 
 
+# Terminating frame of every OpenAI format stream
+SSE_DONE = b"data: [DONE]\n\n"
+
+# Serialize a chunk straight into an SSE frame, with no intermediate str or re-encode
+def sse(chunk):
+    return b"data: " + orjson.dumps(chunk) + b"\n\n"
+
+# Prebuilt error chunk; only the dynamic fields are serialized when an error is streamed
+ERROR_CHUNK_TEMPLATE = (
+    b'data: {"id":%s,"object":"chat.completion.chunk","created":%d,"model":%s,"system_fingerprint":%s,'
+    b'"choices":[{"index":0,"delta":{"content":%s},"logprobs":null,"finish_reason":"stop"}]}\n\n'
+)
+TIMEOUT_ERROR_CONTENT = orjson.dumps("I apologize, but I'm having trouble processing your request right now. Please try again.")
+HTTP_ERROR_CONTENT = orjson.dumps("I encountered an error while processing your request. Please try again later.")
+UNEXPECTED_ERROR_CONTENT = orjson.dumps("An unexpected error occurred. Please try again.")
+
+# Build an OpenAI format error chunk from the prebuilt template
+def sse_error_chunk(response_id, created_time, model, system_fp, content):
+    return ERROR_CHUNK_TEMPLATE % (orjson.dumps(response_id), created_time, orjson.dumps(model), orjson.dumps(system_fp), content)
+
+# Yield the data payload of each SSE event as bytes, joining multi-line data fields
+async def iter_sse_data(response):
+    buffer = bytearray()
+    data_lines = []
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        start = 0
+        # Only complete lines are parsed; a partial line stays buffered until the next chunk
+        while (end := buffer.find(b"\n", start)) != -1:
+            line = bytes(buffer[start:end]).rstrip(b"\r")
+            start = end + 1
+            if not line:
+                # A blank line terminates the current event
+                if data_lines:
+                    yield b"\n".join(data_lines)
+                    data_lines = []
+            elif line.startswith(b"data:"):
+                logger.debug("Received data: %s", line)
+                data_lines.append(line[5:].strip())
+        del buffer[:start]
+    if buffer.startswith(b"data:"):
+        data_lines.append(bytes(buffer[5:]).strip())
+    if data_lines:
+        yield b"\n".join(data_lines)
+
 async def stream_watsonx_completions(watsonx_payload, headers):
     logger.info("Stream chat completion request.")
-    async with httpx.AsyncClient(timeout=120.0) as client:  # Aumentar timeout
-        try:
-            # Send the request to Watsonx.ai
-            response = await client.post(WATSONX_URL_STREAM, json=watsonx_payload, headers=headers)
+
+    # Generate unique ID and fingerprint once for every chunk of the response
+    response_id = f"chatcmpl-{random_id()}"
+    system_fp = f"fp_{random_id()}"
+    created_time = int(time.time())
+    model = watsonx_payload.get("model_id", "ibm/granite-20b-multilingual")
+
+    try:
+        # Send the request to Watsonx.ai and read the response as it streams in
+        async with app.state.http.stream("POST", settings().watsonx_url_stream, content=orjson.dumps(watsonx_payload), headers=headers) as response:
+            if response.is_error:
+                # Load the error body so it can be logged below
+                await response.aread()
             response.raise_for_status()
             
-            # Generate unique ID for the response
-            response_id = f"chatcmpl-{str(uuid.uuid4())[:12]}"
-            created_time = int(time.time())
-            model = watsonx_payload.get("model_id", "ibm/granite-20b-multilingual")
-            
             # Send initial chunk
             initial_chunk = {
                 "id": response_id,
                 "object": "chat.completion.chunk",
                 "created": created_time,
                 "model": model,
-                "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
+                "system_fingerprint": system_fp,
                 "choices": [{
                     "index": 0,
                     "delta": {
@@ -488,81 +733,73 @@ async def stream_watsonx_completions(watsonx_payload, headers):
                 "usage": None
             }
             
-            yield f"data: {json.dumps(initial_chunk)}\n\n".encode('utf-8')
+            yield sse(initial_chunk)
             
             # Process the streaming response
             accumulated_content = ""
+
+            # OpenAI format chunk reused for every token; only the delta content changes
+            content_delta = {"content": ""}
+            chunk_response = {
+                "id": response_id,
+                "object": "chat.completion.chunk",
+                "created": created_time,
+                "model": model,
+                "system_fingerprint": system_fp,
+                "choices": [{
+                    "index": 0,
+                    "delta": content_delta,
+                    "logprobs": None,
+                    "finish_reason": None
+                }],
+                "usage": None
+            }
             
-            async for chunk in response.aiter_bytes():
-                chunk_str = chunk.decode('utf-8').strip()
-                logger.debug(f"Received chunk: {chunk_str}")
+            async for data in iter_sse_data(response):
+                if data == b"[DONE]":
+                    # Send final chunk
+                    final_chunk = {
+                        "id": response_id,
+                        "object": "chat.completion.chunk",
+                        "created": created_time,
+                        "model": model,
+                        "system_fingerprint": system_fp,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {},
+                            "logprobs": None,
+                            "finish_reason": "stop"
+                        }],
+                        "usage": None
+                    }
+                    yield sse(final_chunk)
+                    yield SSE_DONE
+                    return
                 
-                # Process each line in the chunk
-                for line in chunk_str.split('\n'):
-                    line = line.strip()
-                    if line.startswith('data:'):
-                        data_str = line[5:].strip()
-                        if data_str == "[DONE]":
-                            # Send final chunk
-                            final_chunk = {
-                                "id": response_id,
-                                "object": "chat.completion.chunk",
-                                "created": created_time,
-                                "model": model,
-                                "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {},
-                                    "logprobs": None,
-                                    "finish_reason": "stop"
-                                }],
-                                "usage": None
-                            }
-                            yield f"data: {json.dumps(final_chunk)}\n\n".encode('utf-8')
-                            yield b"data: [DONE]\n\n"
-                            return
+                try:
+                    data_json = orjson.loads(data)
+                    
+                    # Extract content from watsonx response
+                    choices = data_json.get('choices', [])
+                    if choices and len(choices) > 0:
+                        choice = choices[0]
+                        if 'message' in choice:
+                            content = choice['message'].get('content', '')
+                        elif 'delta' in choice:
+                            content = choice['delta'].get('content', '')
+                        else:
+                            continue
                         
-                        try:
-                            data_json = json.loads(data_str)
+                        if content:
+                            accumulated_content += content
                             
-                            # Extract content from watsonx response
-                            choices = data_json.get('choices', [])
-                            if choices and len(choices) > 0:
-                                choice = choices[0]
-                                if 'message' in choice:
-                                    content = choice['message'].get('content', '')
-                                elif 'delta' in choice:
-                                    content = choice['delta'].get('content', '')
-                                else:
-                                    continue
-                                
-                                if content:
-                                    accumulated_content += content
-                                    
-                                    # Create OpenAI format chunk
-                                    chunk_response = {
-                                        "id": response_id,
-                                        "object": "chat.completion.chunk",
-                                        "created": created_time,
-                                        "model": model,
-                                        "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
-                                        "choices": [{
-                                            "index": 0,
-                                            "delta": {
-                                                "content": content
-                                            },
-                                            "logprobs": None,
-                                            "finish_reason": None
-                                        }],
-                                        "usage": None
-                                    }
-                                    
-                                    yield f"data: {json.dumps(chunk_response)}\n\n".encode('utf-8')
-                                    
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSONDecodeError: {e}, data: {data_str}")
-                            continue
+                            content_delta["content"] = content
+                            yield sse(chunk_response)
                             
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"JSONDecodeError: {e}, data: {data}")
+                    continue
+                    
             # Fallback: if no proper streaming chunks received, create a simple response
             if not accumulated_content:
                 simple_chunk = {
@@ -570,7 +807,7 @@ async def stream_watsonx_completions(watsonx_payload, headers):
                     "object": "chat.completion.chunk",
                     "created": created_time,
                     "model": model,
-                    "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
+                    "system_fingerprint": system_fp,
                     "choices": [{
                         "index": 0,
                         "delta": {
@@ -581,7 +818,7 @@ async def stream_watsonx_completions(watsonx_payload, headers):
                     }],
                     "usage": None
                 }
-                yield f"data: {json.dumps(simple_chunk)}\n\n".encode('utf-8')
+                yield sse(simple_chunk)
                 
                 # Send finish chunk
                 final_chunk = {
@@ -589,7 +826,7 @@ async def stream_watsonx_completions(watsonx_payload, headers):
                     "object": "chat.completion.chunk",
                     "created": created_time,
                     "model": model,
-                    "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
+                    "system_fingerprint": system_fp,
                     "choices": [{
                         "index": 0,
                         "delta": {},
@@ -598,86 +835,69 @@ async def stream_watsonx_completions(watsonx_payload, headers):
                     }],
                     "usage": None
                 }
-                yield f"data: {json.dumps(final_chunk)}\n\n".encode('utf-8')
+                yield sse(final_chunk)
                 
-            yield b"data: [DONE]\n\n"
+            yield SSE_DONE
                             
-        except httpx.ReadTimeout as err:
-            logger.error(f"ReadTimeout: {err}")
-            # Return error in OpenAI streaming format
-            error_chunk = {
-                "id": f"chatcmpl-{str(uuid.uuid4())[:12]}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": watsonx_payload.get("model_id", "ibm/granite-20b-multilingual"),
-                "choices": [{
-                    "index": 0,
-                    "delta": {
-                        "content": "I apologize, but I'm having trouble processing your request right now. Please try again."
-                    },
-                    "logprobs": None,
-                    "finish_reason": "stop"
-                }]
-            }
-            yield f"data: {json.dumps(error_chunk)}\n\n".encode('utf-8')
-            yield b"data: [DONE]\n\n"
-            
-        except httpx.HTTPStatusError as err:
-            logger.error(f"HTTPError: {err}")
-            error_message = await response.aread() if hasattr(response, 'aread') else "Unknown error"
-            logger.error(f"Response: {error_message}")
-            
-            error_chunk = {
-                "id": f"chatcmpl-{str(uuid.uuid4())[:12]}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": watsonx_payload.get("model_id", "ibm/granite-20b-multilingual"),
-                "choices": [{
-                    "index": 0,
-                    "delta": {
-                        "content": "I encountered an error while processing your request. Please try again later."
-                    },
-                    "logprobs": None,
-                    "finish_reason": "stop"
-                }]
-            }
-            yield f"data: {json.dumps(error_chunk)}\n\n".encode('utf-8')
-            yield b"data: [DONE]\n\n"
-            
-        except Exception as err:
-            logger.error(f"Unexpected error: {err}")
-            error_chunk = {
-                "id": f"chatcmpl-{str(uuid.uuid4())[:12]}",
-                "object": "chat.completion.chunk", 
-                "created": int(time.time()),
-                "model": watsonx_payload.get("model_id", "ibm/granite-20b-multilingual"),
-                "choices": [{
-                    "index": 0,
-                    "delta": {
-                        "content": "An unexpected error occurred. Please try again."
-                    },
-                    "logprobs": None,
-                    "finish_reason": "stop"
-                }]
-            }
-            yield f"data: {json.dumps(error_chunk)}\n\n".encode('utf-8')
-            yield b"data: [DONE]\n\n"
+    except httpx.ReadTimeout as err:
+        logger.error(f"ReadTimeout: {err}")
+        # Return error in OpenAI streaming format
+        yield sse_error_chunk(response_id, created_time, model, system_fp, TIMEOUT_ERROR_CONTENT)
+        yield SSE_DONE
+        
+    except httpx.HTTPStatusError as err:
+        logger.error(f"HTTPError: {err}")
+        error_message = err.response.text
+        logger.error(f"Response: {error_message}")
+        
+        yield sse_error_chunk(response_id, created_time, model, system_fp, HTTP_ERROR_CONTENT)
+        yield SSE_DONE
+        
+    except Exception as err:
+        logger.error(f"Unexpected error: {err}")
+        yield sse_error_chunk(response_id, created_time, model, system_fp, UNEXPECTED_ERROR_CONTENT)
+        yield SSE_DONE
+
+# Parse the raw request body with orjson instead of Starlette's stdlib json
+async def parse_json(request):
+    return orjson.loads(await request.body())
+
+# Skeletons of a non-streaming chat choice; copied and filled in per choice
+CHAT_MESSAGE_TEMPLATE = {"role": "assistant", "content": "", "tool_calls": None, "function_call": None}
+CHAT_CHOICE_TEMPLATE = {"index": 0, "message": None, "logprobs": None, "finish_reason": "stop"}
+
+# Stand-in for a choice without a message; read-only
+EMPTY_MESSAGE = {}
+
+# Choices returned when Watsonx sends none. Shared by every such response, so it must never be mutated.
+FALLBACK_CHOICES = [{
+    "index": 0,
+    "message": {
+        "role": "assistant",
+        "content": "I understand your request and I'm here to help you.",
+        "tool_calls": None,
+        "function_call": None
+    },
+    "logprobs": None,
+    "finish_reason": "stop"
+}]
 
 async def non_stream_watsonx_completions(watsonx_payload, headers):
     try:
         # Send the request to Watsonx.ai
-        response = requests.post(WATSONX_URL_CHAT, json=watsonx_payload, headers=headers)
+        response = await app.state.http.post(settings().watsonx_url_chat, content=orjson.dumps(watsonx_payload), headers=headers)
         response.raise_for_status()  # This will raise an HTTPError for 4xx/5xx responses
-        watsonx_data = response.json()
-        logger.debug(f"Received response from Watsonx.ai: {json.dumps(watsonx_data, indent=4)}")
+        watsonx_data = orjson.loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received response from Watsonx.ai: %s", orjson.dumps(watsonx_data, option=orjson.OPT_INDENT_2).decode())
         
         # Convert Watsonx response to OpenAI chat completions format
         openai_response = {
-            "id": f"chatcmpl-{str(uuid.uuid4())[:12]}",
+            "id": f"chatcmpl-{random_id()}",
             "object": "chat.completion",
             "created": int(time.time()),
             "model": watsonx_payload.get("model_id", "ibm/granite-20b-multilingual"),
-            "system_fingerprint": f"fp_{str(uuid.uuid4())[:12]}",
+            "system_fingerprint": f"fp_{random_id()}",
             "choices": [],
             "usage": {
                 "prompt_tokens": 0,
@@ -689,39 +909,22 @@ async def non_stream_watsonx_completions(watsonx_payload, headers):
         # Extract choices from Watsonx response
         choices = watsonx_data.get("choices", [])
         if choices:
+            choices_list = [None] * len(choices)
             for i, choice in enumerate(choices):
-                message_content = choice.get("message", {}).get("content", "")
-                finish_reason = choice.get("finish_reason", "stop")
-                
                 # Ensure content is never None
-                if message_content is None:
-                    message_content = ""
+                message_content = (choice.get("message") or EMPTY_MESSAGE).get("content") or ""
                 
-                openai_choice = {
-                    "index": i,
-                    "message": {
-                        "role": "assistant",
-                        "content": message_content,
-                        "tool_calls": None,
-                        "function_call": None
-                    },
-                    "logprobs": None,
-                    "finish_reason": finish_reason
-                }
-                openai_response["choices"].append(openai_choice)
+                message = CHAT_MESSAGE_TEMPLATE.copy()
+                message["content"] = message_content
+                openai_choice = CHAT_CHOICE_TEMPLATE.copy()
+                openai_choice["index"] = i
+                openai_choice["message"] = message
+                openai_choice["finish_reason"] = choice.get("finish_reason", "stop")
+                choices_list[i] = openai_choice
+            openai_response["choices"] = choices_list
         else:
-            # Fallback: create a single choice with proper content
-            openai_response["choices"] = [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "I understand your request and I'm here to help you.",
-                    "tool_calls": None,
-                    "function_call": None
-                },
-                "logprobs": None,
-                "finish_reason": "stop"
-            }]
+            # Fallback: a single choice with proper content
+            openai_response["choices"] = FALLBACK_CHOICES
         
         # Extract usage information if available
         usage = watsonx_data.get("usage", {})
@@ -732,47 +935,80 @@ async def non_stream_watsonx_completions(watsonx_payload, headers):
                 "total_tokens": usage.get("total_tokens", 0)
             }
         
-        logger.debug(f"Converted to OpenAI format: {json.dumps(openai_response, indent=4)}")
-        return openai_response
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Converted to OpenAI format: %s", orjson.dumps(openai_response, option=orjson.OPT_INDENT_2).decode())
+        # Return the response directly so FastAPI skips the jsonable_encoder pass
+        return ORJSONResponse(openai_response)
         
-    except requests.exceptions.HTTPError as err:
+    except httpx.HTTPStatusError as err:
         # Capture and log the full response from Watsonx.ai
         error_message = response.text  # Watsonx should return a more detailed error message
         logger.error(f"HTTPError: {err}, Response: {error_message}")
         raise HTTPException(status_code=response.status_code, detail=f"Error from Watsonx.ai: {error_message}")
-    except requests.exceptions.RequestException as err:
+    except httpx.RequestError as err:
         # Generic request exception handling
         logger.error(f"RequestException: {err}")
         raise HTTPException(status_code=500, detail=f"Error calling Watsonx.ai: {err}")
 
-@app.post("/v1/chat/completions")
+# Prepare the Watsonx.ai chat payload in one pass, leaving out parameters that were not provided.
+# include_sampling_controls adds seed, frequency_penalty, stop and logit_bias, which the n8n route does not forward.
+def build_chat_payload(request_data, *, temperature, include_sampling_controls):
+    items = [
+        ("messages", request_data.get("messages", [])),
+        ("model_id", request_data.get("model", "ibm/granite-20b-multilingual")),  # Default model_id
+        ("project_id", settings().project_id),
+        ("max_tokens", request_data.get("max_tokens", 2000)),
+        ("temperature", temperature),
+        ("top_p", request_data.get("top_p", 1)),
+        # ("time_limit", 1000),
+    ]
+    if include_sampling_controls:
+        items += [
+            ("seed", request_data.get("seed")),
+            ("frequency_penalty", request_data.get("presence_penalty", 1)),
+            ("stop", request_data.get("stop") or None),
+            ("logit_bias", request_data.get("logit_bias") or None)
+        ]
+    return {k: v for k, v in items if v is not None}
+
+# Send a chat payload to Watsonx.ai, streaming the response back when requested
+async def dispatch_chat_completion(watsonx_payload, stream):
+    # Get the IAM token
+    iam_token = await get_iam_token()
+
+    # Log the prettified JSON request
+    if logger.isEnabledFor(logging.DEBUG):
+        formatted_payload = orjson.dumps(watsonx_payload, option=orjson.OPT_INDENT_2).decode()
+        logger.debug("Sending request to Watsonx.ai: %s", formatted_payload)
+
+    headers = {"Authorization": f"Bearer {iam_token}"}
+    # stream = False # make always not stream as issues for watsonx
+    if stream:
+        return StreamingResponse(
+            stream_watsonx_completions(watsonx_payload, headers), 
+            media_type="text/plain",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Content-Type": "text/plain; charset=utf-8"
+            }
+        )
+    else:
+        return await non_stream_watsonx_completions(watsonx_payload, headers)
+
+# Also served under /v1/chat/chat/completions, the path n8n expects
+@app.post("/v1/chat/completions", response_model=None, response_class=ORJSONResponse)
+@app.post("/v1/chat/chat/completions", response_model=None, response_class=ORJSONResponse)
 async def watsonx_completions(request: Request):
     logger.info("Received a Watsonx chat completion request.")
     # Parse the incoming request as JSON
     try:
-        request_data = await request.json()
+        request_data = await parse_json(request)
         logger.info(f"request_data is {request_data}")
-    except Exception as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"Error parsing request: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON request body")
 
-    messages = request_data.get("messages", [])
-    # Rest of the parameters (model_id, max_tokens, etc.)
-    model_id = request_data.get("model", "ibm/granite-20b-multilingual")  # Default model_id
-    max_tokens = request_data.get("max_tokens", 2000)
-    temperature = request_data.get("temperature", 0.2)
-    best_of = request_data.get("best_of", 1)
-    n = request_data.get("n", 1)
-    presence_penalty = request_data.get("presence_penalty", 1)
-    echo = request_data.get("echo", False)
-    logit_bias = request_data.get("logit_bias", None)
-    logprobs = request_data.get("logprobs", None)
-    stop = request_data.get("stop", None)
-    suffix = request_data.get("suffix", None)
-    stream = request_data.get("stream", False)
-    seed = request_data.get("seed", None)
-    top_p = request_data.get("top_p", 1)
-
     # Handle tool calling parameters that n8n/LangChain might send
     tools = request_data.get("tools", None)
     functions = request_data.get("functions", None)  # Legacy functions parameter
@@ -785,53 +1021,15 @@ async def watsonx_completions(request: Request):
         logger.warning("Tool calling is not fully supported by Watsonx. Converting to regular chat completion.")
 
     # Debugging: Log the provided parameters and their sources
-    logger.debug("Parameter source debug:")
-    logger.debug("\n" + format_debug_output(request_data))
-
-    # Get the IAM token
-    iam_token = get_iam_token()
-
-    # Prepare Watsonx.ai request payload
-    watsonx_payload = {
-        "messages": messages,
-        "seed":seed,
-        "frequency_penalty": presence_penalty,
-        "model_id": model_id,
-        "project_id": PROJECT_ID,
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "top_p": top_p,
-        # "time_limit": 1000
-    }
-
-    # Optionally add optional parameters if provided
-    if stop:
-        watsonx_payload["stop"] = stop
-    if logit_bias:
-        watsonx_payload["logit_bias"] = logit_bias
-
-    # Log the prettified JSON request
-    formatted_payload = json.dumps(watsonx_payload, indent=4, ensure_ascii=False)
-    logger.debug(f"Sending request to Watsonx.ai: {formatted_payload}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Parameter source debug:\n%s", format_debug_output(request_data))
 
-    headers = {
-        "Authorization": f"Bearer {iam_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    # stream = False # make always not stream as issues for watsonx
-    if stream:
-        return StreamingResponse(
-            stream_watsonx_completions(watsonx_payload, headers), 
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/plain; charset=utf-8"
-            }
-        )
-    else:
-        return await non_stream_watsonx_completions(watsonx_payload, headers)
+    watsonx_payload = build_chat_payload(
+        request_data,
+        temperature=request_data.get("temperature", 0.2),
+        include_sampling_controls=True
+    )
+    return await dispatch_chat_completion(watsonx_payload, request_data.get("stream", False))
 
 
 @app.post("/v1/llamaindex/chat/completions")
@@ -839,9 +1037,9 @@ async def watsonx_chat_completions(request: Request):
     logger.info("Received a Watsonx chat completion request.")
     # Parse the incoming request as JSON
     try:
-        request_data = await request.json()
+        request_data = await parse_json(request)
         logger.info(f"request_data is {request_data}")
-    except Exception as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"Error parsing request: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON request body")
 
@@ -858,23 +1056,26 @@ async def watsonx_chat_completions(request: Request):
     # logger.debug("Parameter source debug:")
     # logger.debug("\n" + format_debug_output(request_data))
 
-    watsonx_llm = WatsonxLLM(
+    s = settings()
+    # WatsonxLLM authenticates and calls Watsonx synchronously; run it in a worker thread to keep the event loop free
+    watsonx_llm = await asyncio.to_thread(
+        WatsonxLLM,
         model_id=model_id,
-        # url=WATSONX_URL_CHAT,
-        url=WATSONX_URLS.get(region),
-        project_id=PROJECT_ID,
+        # url=s.watsonx_url_chat,
+        url=s.base_url,
+        project_id=s.project_id,
         temperature=temperature,
         max_new_tokens=max_tokens,
         repetition_penalty=presence_penalty,
         random_seed=seed,
-        apikey=IBM_API_KEY,
+        apikey=s.api_key,
         top_p=top_p
     )
 
     # Extract parameters from request or set default values
     messages = [ChatMessage(**t) for t in request_data.get("messages", [])]
-    response = watsonx_llm.chat(
-        messages, max_new_tokens=max_tokens, decoding_method="greedy"
+    response = await asyncio.to_thread(
+        watsonx_llm.chat, messages, max_new_tokens=max_tokens, decoding_method="greedy"
     )
     logger.info(f"Returning OpenAI-compatible ChatResponse: {response}")
     return response.raw
@@ -883,15 +1084,8 @@ async def watsonx_chat_completions(request: Request):
     #     print(chunk.delta, end="")
     #     yield chunk.delta
 
-# Add compatibility route for n8n which expects /v1/chat/chat/completions
-@app.post("/v1/chat/chat/completions")
-async def watsonx_chat_chat_completions(request: Request):
-    """Compatibility endpoint for n8n which expects /v1/chat/chat/completions path"""
-    logger.info("Received a Watsonx chat completion request via /v1/chat/chat/completions (n8n compatibility route).")
-    return await watsonx_completions(request)
-
 # Optimized endpoint for N8N AI Agents
-@app.post("/v1/n8n/chat/completions")
+@app.post("/v1/n8n/chat/completions", response_model=None, response_class=ORJSONResponse)
 async def n8n_optimized_completions(request: Request):
     """
     Optimized endpoint for N8N AI Agents with better tool calling support
@@ -899,19 +1093,12 @@ async def n8n_optimized_completions(request: Request):
     logger.info("Received an N8N optimized chat completion request.")
     
     try:
-        request_data = await request.json()
+        request_data = await parse_json(request)
         logger.info(f"N8N request_data: {request_data}")
-    except Exception as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"Error parsing N8N request: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON request body")
 
-    messages = request_data.get("messages", [])
-    model_id = request_data.get("model", "ibm/granite-20b-multilingual")
-    max_tokens = request_data.get("max_tokens", 2000)
-    temperature = request_data.get("temperature", 0.7)
-    stream = request_data.get("stream", False)
-    top_p = request_data.get("top_p", 1)
-    
     # Handle tool calling parameters
     tools = request_data.get("tools", None)
     tool_choice = request_data.get("tool_choice", None)
@@ -919,60 +1106,29 @@ async def n8n_optimized_completions(request: Request):
     if tools or tool_choice:
         logger.info("N8N Tool calling detected, adjusting response format")
 
-    # Get the IAM token
-    iam_token = get_iam_token()
-
-    # Prepare Watsonx.ai request payload
-    watsonx_payload = {
-        "messages": messages,
-        "model_id": model_id,
-        "project_id": PROJECT_ID,
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "top_p": top_p,
-    }
-
-    headers = {
-        "Authorization": f"Bearer {iam_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-
-    if stream:
-        return StreamingResponse(
-            stream_watsonx_completions(watsonx_payload, headers), 
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/plain; charset=utf-8"
-            }
-        )
-    else:
-        return await non_stream_watsonx_completions(watsonx_payload, headers)
-
-# Add compatibility routes for n8n which might expect /v1/chat/chat/models
-@app.get("/v1/chat/chat/models")
-async def fetch_models_compatibility():
-    """Compatibility endpoint for n8n which might expect /v1/chat/chat/models path"""
-    logger.info("Received models request via /v1/chat/chat/models (n8n compatibility route).")
-    return await fetch_models()
-
-@app.get("/v1/chat/chat/models/{model_id}")
-async def fetch_model_by_id_compatibility(model_id: str):
-    """Compatibility endpoint for n8n which might expect /v1/chat/chat/models/{model_id} path"""
-    logger.info(f"Received model by ID request via /v1/chat/chat/models/{model_id} (n8n compatibility route).")
-    return await fetch_model_by_id(model_id)
-
-# Add standard OpenAI endpoints that some clients expect
-@app.get("/v1/models")
-async def fetch_models_standard():
-    """Standard OpenAI models endpoint"""
-    logger.info("Received models request via /v1/models (standard OpenAI route).")
-    return await fetch_models()
-
-@app.get("/v1/models/{model_id}")
-async def fetch_model_by_id_standard(model_id: str):
-    """Standard OpenAI model by ID endpoint"""
-    logger.info(f"Received model by ID request via /v1/models/{model_id} (standard OpenAI route).")
-    return await fetch_model_by_id(model_id)
\ No newline at end of file
+    watsonx_payload = build_chat_payload(
+        request_data,
+        temperature=request_data.get("temperature", 0.7),
+        include_sampling_controls=False
+    )
+    return await dispatch_chat_completion(watsonx_payload, request_data.get("stream", False))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Workers re-import this module; pass on the region chosen interactively so they don't prompt again
+    os.environ["WATSONX_REGION"] = region
+    uvicorn.run(
+        "watsonxai_endpoint:app",
+        host=os.getenv("HOST") or "0.0.0.0",
+        port=int(os.getenv("PORT") or 8080),
+        # uvloop and httptools when installed (uvloop is skipped on Windows), otherwise asyncio and h11
+        loop="auto",
+        http="auto",
+        # Each worker keeps its own IAM token, model cache and connection pool, so scaling out is opt-in
+        workers=int(os.getenv("UVICORN_WORKERS") or 1),
+        # The app already logs every request at INFO level through its own logger
+        log_level="warning",
+        access_log=False
+    )